@@ -4,19 +4,364 @@
 # Monte-Carlo Option Pricing
 
 
-from scipy.stats import norm
+from scipy.stats import norm, qmc
+from scipy.special import ndtri
+import numpy as np
 import math
-from random import *
-import statistics
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, reduce
+from random import gauss
 import time
 
+try:
+    from numba import njit, prange, threading_layer
+except ImportError:         # numba is optional; only jit=True needs it
+    njit = None
+    prange = range
+
+
+
+# The NumPy pipeline stores paths in single precision: its rounding error is far below the
+# Monte Carlo error, and it halves the memory traffic. Payoffs are averaged in float64.
+_PATH_DTYPE = np.float32
+
+# Trials are streamed through the NumPy pipeline in chunks with about this many bytes of
+# normals, so that each chunk stays cache-resident.
+_CHUNK_BYTES = 256 * 1024
+
+
+@lru_cache(maxsize=None)
+def _brownian_bridge(nsteps):
+    
+    '''Return the (nsteps, nsteps) matrix B such that z @ B.T is a Brownian path sampled at
+    times 1..nsteps (in units of one time step), built coarse-to-fine from the columns of z:
+    z[:, 0] fixes the end point, z[:, 1] the midpoint, and so on by bisection.'''
+    
+    B = np.zeros((nsteps + 1, nsteps))        # row k is W(k) in terms of z; W(0) = 0
+    B[nsteps, 0] = math.sqrt(nsteps)
+    
+    j = 1
+    intervals = [(0, nsteps)]
+    while intervals:
+        finer = []
+        for left, right in intervals:
+            mid = (left + right) // 2
+            if mid == left:
+                continue
+            B[mid] = ((right - mid)*B[left] + (mid - left)*B[right]) / (right - left)
+            B[mid, j] = math.sqrt((mid - left)*(right - mid) / (right - left))
+            j += 1
+            finer += [(left, mid), (mid, right)]
+        intervals = finer
+    
+    B = B[1:].astype(_PATH_DTYPE)
+    B.flags.writeable = False
+    return B
+
+
+
+def _mc_trial_chunk(args):
+    
+    '''Price one chunk of trials in a worker process and return its (count, mean, M2) summary.'''
+    
+    option_class, params, options = args
+    option = option_class(*params, **options)
+    option.value()
+    return option._summary
+
+
+def _chunk_rows(nsteps):
+    
+    '''Return the number of paths per chunk, sized so that their normals take about _CHUNK_BYTES.'''
+    
+    return max(2, _CHUNK_BYTES // (nsteps * np.dtype(_PATH_DTYPE).itemsize))
+
+
+def _black_scholes_d(s, x, r, sigma, t):
+    
+    '''Return the d1 and d2 terms of the Black-Scholes formula; sigma and t must be positive.'''
+    
+    d1 = (math.log(s/x) + (r + ((sigma **2)/2))*t) / (sigma*math.sqrt(t))
+    return d1, d1 - sigma*math.sqrt(t)
+
+
+def _worker_context(cls):
+    
+    '''Return the multiprocessing context for a worker pool pricing options of type cls.
+    
+    Workers are forked as usual, unless a jit=True run has already started numba's threading
+    layer in this process, as forking then can hang the interpreter at exit; forkserver or spawn
+    is used instead, whose workers must re-import the module that defines cls.'''
+    
+    context = multiprocessing.get_context()
+    if _numba_threads_started():
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    
+    # A REPL, notebook or piped script has no main file for the workers to re-run.
+    main_file = getattr(sys.modules['__main__'], '__file__', None)
+    if context.get_start_method() != 'fork' and cls.__module__ == '__main__' and not (main_file and os.path.isfile(main_file)):
+        raise RuntimeError(f'workers > 1 cannot start {context.get_start_method()} workers for {cls.__name__}, '
+                           'as it is defined in an interactive session: import it from a module file instead')
+    return context
+
+
+def _numba_threads_started():
+    
+    '''Return whether numba's threading layer has been started in this process.'''
+    
+    if njit is None:
+        return False
+    try:
+        threading_layer()
+    except ValueError:          # raised until a parallel kernel has run
+        return False
+    return True
+
+
+def _gbm_paths(z, s, r, sigma, t, bridge=False):
+    
+    '''Return the geometric Brownian motion paths from s over time t driven by a (n, nsteps)
+    array of normals, as a (n, nsteps+1) array. With bridge=True the normals are read through
+    a Brownian bridge instead of as successive increments.'''
+    
+    nsteps = z.shape[1]
+    dt = t/nsteps
+    
+    a = r - ((sigma **2)/2)
+    
+    a_dt = a*dt
+    vol_sqdt = sigma*math.sqrt(dt)
+    
+    # Every step below writes into the columns 1..nsteps of the result, so each pass
+    # streams through one buffer instead of allocating a new temporary.
+    paths = np.empty((len(z), nsteps + 1), dtype=_PATH_DTYPE)
+    paths[:, 0] = s
+    log_paths = paths[:, 1:]
+    
+    if bridge:
+        # Brownian bridge: the leading, best distributed Sobol' coordinates set the coarse path shape.
+        np.matmul(z, _brownian_bridge(nsteps).T, out=log_paths)
+        log_paths *= vol_sqdt
+        log_paths += a_dt*np.arange(1, nsteps + 1, dtype=_PATH_DTYPE)
+    else:
+        np.multiply(z, vol_sqdt, out=log_paths)
+        log_paths += a_dt
+        np.cumsum(log_paths, axis=1, out=log_paths)
+    
+    np.exp(log_paths, out=log_paths)
+    log_paths *= s
+    
+    return paths
+
+
+def _summary_of(samples):
+    
+    '''Return the (count, mean, M2) summary of a 1-d array of independent samples.'''
+    
+    # The same summary that the kernel and the workers produce; M2 is a dot product of
+    # the deviations, with no squared copy.
+    mean = samples.mean()
+    deviations = samples - mean
+    return len(samples), mean, np.dot(deviations, deviations)
+
+
+def _combine_summaries(a, b):
+    
+    '''Merge two (count, mean, M2) summaries with the pairwise form of Welford's update.'''
+    
+    na, mean_a, m2_a = a
+    nb, mean_b, m2_b = b
+    n = na + nb
+    delta = mean_b - mean_a
+    return n, mean_a + delta*nb/n, m2_a + m2_b + delta**2 * na*nb/n
+
+
+def _terminal(paths, axis):
+    
+    '''Reduce each path to its final price.'''
+    
+    return np.take(paths, -1, axis=axis)
+
+
+def _call(level, x):
+    
+    '''Call payoff of the reduced price level against the strike x.'''
+    
+    return np.maximum(level - x, 0.0)
+
+
+def _put(level, x):
+    
+    '''Put payoff of the reduced price level against the strike x.'''
+    
+    return np.maximum(x - level, 0.0)
+
+
+# Payoff reductions of one path, as understood by the compiled kernel.
+_TERMINAL, _AVERAGE, _MAXIMUM, _MINIMUM = range(4)
+_KERNEL_REDUCERS = {_terminal: _TERMINAL, np.mean: _AVERAGE, np.max: _MAXIMUM, np.min: _MINIMUM}
+
+# The compiled kernel splits the trials into this many independent random streams, so a
+# seeded result does not depend on the number of threads.
+_JIT_BLOCKS = 256
+
+
+def _splitmix64(x):
+    
+    '''Return the splitmix64 hash of the uint64 x, used to seed the xoshiro256** state.'''
+    
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _rotl(x, k):
+    
+    '''Rotate the uint64 x left by k bits.'''
+    
+    return (x << np.uint64(k)) | (x >> np.uint64(64 - k))
+
+
+def _xoshiro_uniform(state):
+    
+    '''Advance the xoshiro256** state in place and return a uniform draw in (0, 1].'''
+    
+    result = _rotl(state[1] * np.uint64(5), 7) * np.uint64(9)
+    shifted = state[1] << np.uint64(17)
+    state[2] ^= state[0]
+    state[3] ^= state[1]
+    state[1] ^= state[2]
+    state[0] ^= state[3]
+    state[2] ^= shifted
+    state[3] = _rotl(state[3], 45)
+    return ((result >> np.uint64(11)) + np.uint64(1)) * (1.0 / 9007199254740992.0)
+
+
+def _path_step(reducer, acc, price):
+    
+    '''Fold the next price of a path into its running sum, max or min.'''
+    
+    if reducer == _AVERAGE:
+        return acc + price
+    if reducer == _MAXIMUM:
+        return max(acc, price)
+    if reducer == _MINIMUM:
+        return min(acc, price)
+    return acc
+
+
+def _path_payoff(reducer, is_call, acc, price, x, nsteps):
+    
+    '''Return the undiscounted payoff of a path from its running value acc and final price.'''
+    
+    if reducer == _TERMINAL:
+        level = price
+    elif reducer == _AVERAGE:
+        level = acc / (nsteps + 1)
+    else:
+        level = acc
+    
+    if is_call:
+        return max(level - x, 0.0)
+    return max(x - level, 0.0)
+
+
+def _mc_kernel(s, x, r, sigma, t, nsteps, ntrials, seeds, reducer, is_call, antithetic):
+    
+    '''Price ntrials paths without storing them, and return per-block (count, mean, M2) arrays.
+    
+    Each block of trials runs its own xoshiro256** stream, seeded from its word of seeds, with
+    Box-Muller normals and keeps only the running price and the running sum, max or min of each path.'''
+    
+    dt = t/nsteps
+    a_dt = (r - ((sigma **2)/2)) * dt
+    vol = sigma * math.sqrt(dt)
+    disc = math.exp(-1*r*t)
+    
+    nblocks = min(_JIT_BLOCKS, ntrials)
+    counts = np.zeros(nblocks, np.int64)
+    means = np.zeros(nblocks)
+    m2s = np.zeros(nblocks)
+    
+    for b in prange(nblocks):
+        state = np.empty(4, np.uint64)
+        word = seeds[b]
+        for i in range(4):
+            word = _splitmix64(word)
+            state[i] = word
+        
+        n = 0
+        mean = 0.0
+        m2 = 0.0
+        spare = 0.0
+        has_spare = False
+        for trial in range(b*ntrials // nblocks, (b+1)*ntrials // nblocks):
+            price = s
+            acc = s
+            mirror = s
+            mirror_acc = s
+            for k in range(nsteps):
+                if has_spare:
+                    z = spare
+                    has_spare = False
+                else:
+                    radius = math.sqrt(-2.0 * math.log(_xoshiro_uniform(state)))
+                    angle = 2.0 * math.pi * _xoshiro_uniform(state)
+                    z = radius * math.cos(angle)
+                    spare = radius * math.sin(angle)
+                    has_spare = True
+                
+                price *= math.exp(a_dt + vol*z)
+                acc = _path_step(reducer, acc, price)
+                # The mirror path is only simulated when it is used.
+                if antithetic:
+                    mirror *= math.exp(a_dt - vol*z)
+                    mirror_acc = _path_step(reducer, mirror_acc, mirror)
+            
+            sample = _path_payoff(reducer, is_call, acc, price, x, nsteps) * disc
+            if antithetic:
+                sample = (sample + _path_payoff(reducer, is_call, mirror_acc, mirror, x, nsteps) * disc) / 2
+            
+            # Welford's update, so a block keeps three scalars instead of its payoffs.
+            n += 1
+            delta = sample - mean
+            mean += delta / n
+            m2 += delta * (sample - mean)
+        
+        counts[b] = n
+        means[b] = mean
+        m2s[b] = m2
+    
+    return counts, means, m2s
+
+
+if njit is not None:
+    _splitmix64 = njit(inline='always')(_splitmix64)
+    _rotl = njit(inline='always')(_rotl)
+    _xoshiro_uniform = njit(inline='always')(_xoshiro_uniform)
+    _path_step = njit(inline='always')(_path_step)
+    _path_payoff = njit(inline='always')(_path_payoff)
+    try:
+        _mc_kernel = njit(parallel=True, fastmath=True, cache=True)(_mc_kernel)
+    except RuntimeError:        # no cache locator, e.g. when the source was exec'd or piped in
+        _mc_kernel = njit(parallel=True, fastmath=True)(_mc_kernel)
+
 
 
 class MCStockOption:
     
     '''Defined a Monte Carlo Stock option class.'''
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
+    # No per-instance __dict__, as chains and calibrations create many of these objects.
+    __slots__ = ('s', 'x', 'r', 'sigma', 't', 'nsteps', 'ntrials', '_ss', '_rng', 'sobol', 'replicates',
+                 'antithetic', 'workers', 'jit', 'mean', 'stdev', 'nsamples', '_summary')
+    
+    def __init__(self, s, x, r, sigma, t, nsteps, ntrials, seed=None, sobol=False, replicates=16, antithetic=False, workers=1, jit=False):
         
         '''Initialize a MCStockOption object'''
         
@@ -28,34 +373,121 @@ class MCStockOption:
         self.nsteps = nsteps
         self.ntrials = ntrials
         
+        # seed makes the batched simulation reproducible; None draws fresh entropy. Workers and
+        # Sobol' replicates get independent child streams spawned from the SeedSequence, rather
+        # than correlated seeds like seed + i; each block of the compiled kernel seeds its
+        # stream from its own word of one spawned child's state.
+        self._ss = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self._rng = np.random.default_rng(self._ss)
+        
+        # sobol switches to randomised quasi-Monte Carlo: `replicates` independently
+        # scrambled Sobol' point sets, whose spread gives the standard error.
+        if sobol and replicates < 2:
+            raise ValueError('sobol=True needs replicates >= 2 to estimate the standard error')
+        self.sobol = sobol
+        self.replicates = replicates
+        
+        # antithetic pairs every pseudo-random draw z with -z; the pair averages are the samples.
+        self.antithetic = antithetic
+        
+        # workers > 1 splits the trials over that many processes; None uses every core. The
+        # option class must then live in a module file the workers can import (not a REPL or
+        # notebook cell once jit=True has run), and a script should guard its entry point with
+        # if __name__ == '__main__', as workers started by forkserver or spawn re-run it.
+        self.workers = workers or os.cpu_count()
+        
+        # jit runs the pseudo-random simulation in a compiled Numba kernel that never stores
+        # the paths; Sobol' sampling always uses the NumPy pipeline.
+        if jit and njit is None:
+            raise ImportError('jit=True needs numba to be installed')
+        self.jit = jit
+        
     
     def __repr__(self):
         
         '''Method to return a string representation of the object'''
         
-        return 'MCStockOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+        return f'{type(self).__name__}, {self._repr_fields()}'
+    
+    
+    def _repr_fields(self):
+        
+        '''Method to return the parameters part of the string representation'''
+        
+        return (f's={self.s:4.2f}, x={self.x:4.2f}, r={self.r:0.2f}, sigma={self.sigma:4.2f}, '
+                f't={self.t:4.2f}, nsteps={self.nsteps}, ntrials={self.ntrials}')
                 
     
   
     def generate_stock_prices(self):
         
-        '''Method to get stock prices from Monte Carlo Simulation.'''
+        '''Method to get the stock prices of one path from Monte Carlo Simulation.
+        
+        Kept as a single-path helper: value() does not use it, and simulates its paths in batches.'''
         
         dt = self.t/self.nsteps
         
         a = self.r - ((self.sigma **2)/2)
         
+        # Loop invariants, and local aliases to skip the global lookups in the comprehension.
+        a_dt = a*dt
+        vol_sqdt = self.sigma*math.sqrt(dt)
+        _exp = math.exp
+        _gauss = gauss
+        
         #here random.gauss gave me an error. So I imported random and used only gauss.
-        sim_stk_rtn = [ math.exp((a*dt + gauss(0,1)*self.sigma*(dt ** 0.5))) for x in range(self.nsteps) ]
+        sim_stk_rtn = [ _exp(a_dt + _gauss(0,1)*vol_sqdt) for x in range(self.nsteps) ]
         
-        stk_price = [self.s]
+        stk_price = [0.0] * (self.nsteps + 1)
+        stk_price[0] = self.s
         
-        for i in sim_stk_rtn:
-            stk_price += [stk_price [-1] * i]
+        for k, i in enumerate(sim_stk_rtn):
+            stk_price[k+1] = stk_price[k] * i
         
         return stk_price
     
+    
+    def _standard_normals(self, ntrials, engine=None):
+        
+        '''Method to draw the normal increments of ntrials paths, as a (ntrials, nsteps) array.
+        
+        Sobol' points come from engine; otherwise the draws are pseudo-random, and with
+        antithetic=True the rows are rounded up to an even number.'''
+        
+        if engine is not None:
+            return ndtri(engine.random(ntrials)).astype(_PATH_DTYPE)
+        
+        if self.antithetic:
+            z = self._rng.standard_normal(((ntrials + 1) // 2, self._ndims()), dtype=_PATH_DTYPE)
+            return np.concatenate([z, -z])
+        return self._rng.standard_normal((ntrials, self._ndims()), dtype=_PATH_DTYPE)
+    
+    
+    def _sobol_engines(self):
+        
+        '''Method to get one scrambled Sobol' engine per replicate, and the number of points each draws.'''
+        
+        # Sobol' points are balanced in blocks of 2**m, so each replicate is rounded up to one.
+        npoints = 2 ** max(0, math.ceil(math.log2(self.ntrials / self.replicates)))
+        engines = [qmc.Sobol(d=self._ndims(), scramble=True, seed=np.random.default_rng(child))
+                   for child in self._ss.spawn(self.replicates)]
+        
+        return engines, npoints
+    
+    
+    def _ndims(self):
+        
+        '''Method to return the number of simulated steps per path, i.e. the normals drawn per trial.'''
+        
+        return self.nsteps
+    
+    
+    def _generate_paths_batch(self, z):
+        
+        '''Method to get the stock price paths driven by a (n, ndims) array of normals, as a (n, ndims+1) array.'''
+        
+        return _gbm_paths(z, self.s, self.r, self.sigma, self.t, bridge=self.sobol)
+    
    
     def value(self):
         
@@ -65,137 +497,214 @@ class MCStockOption:
         return 0
     
   
-    def stderr(self):
+    def _summarize(self, opt_values):
         
-        '''Method to calculate the standard deviation error.'''
+        '''Method to get the (count, mean, M2) summary of a chunk of pseudo-random discounted payoffs.'''
         
-        if 'stdev' in dir(self):
-            return self.stdev / math.sqrt(self.ntrials)
-        return 0
+        opt_values = opt_values.astype(np.float64)
+        if self.antithetic:
+            # Average each path with its mirror image, so the samples stay independent.
+            half = len(opt_values) // 2
+            return _summary_of((opt_values[:half] + opt_values[half:]) / 2)
+        
+        return _summary_of(opt_values)
     
-
-
-# European Call option
-class MCEuroCallOption(MCStockOption):
     
-    '''Defined a Monte Carlo European call option class.'''
+    def _set_summary(self, n, mean, m2):
+        
+        '''Method to set the mean, stdev and nsamples from the count, mean and sum of squared
+        deviations of the independent samples.'''
+        
+        self._summary = (n, mean, m2)
+        self.mean = float(mean)
+        self.stdev = math.sqrt(m2 / (n - 1 if self.sobol else n))
+        self.nsamples = int(n)
+        
+        return self.mean
     
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
+    def _value_batch(self, reducer, payoff):
         
-        '''Initialize a MCEuroCallOption object from MCStockOption class'''
+        '''Method to calculate the value of an option whose payoff(price, x) depends on a path
+        through reducer(paths, axis), e.g. np.mean for an Asian option.'''
         
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
+        if self.workers > 1:
+            return self._value_parallel()
+        if self.jit and not self.sobol:
+            return self._value_jit(reducer, payoff)
         
+        disc = math.exp(-1*self.r * self.t)
         
+        def chunk_values(ntrials, engine=None):
+            paths = self._generate_paths_batch(self._standard_normals(ntrials, engine))
+            return payoff(reducer(paths, axis=1), self.x) * disc
         
-    def __repr__(self):
+        # Stream the trials in chunks, so that the temporaries stay in cache and the full
+        # path matrix is never allocated.
+        rows = _chunk_rows(self._ndims())
         
-        '''Method to return a string representation of the object'''
+        if self.sobol:
+            # The replicate means are the independent samples of a randomised QMC estimate;
+            # chunks of 2**m rows keep each engine's draws balanced.
+            rows = 2 ** int(math.log2(rows))
+            engines, npoints = self._sobol_engines()
+            rep_means = [sum(chunk_values(min(rows, npoints - start), engine).sum(dtype=np.float64)
+                             for start in range(0, npoints, rows)) / npoints
+                         for engine in engines]
+            return self._set_summary(*_summary_of(np.array(rep_means)))
         
-        return 'MCEuroCallOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+        # An even chunk keeps every antithetic pair inside one chunk.
+        rows -= rows % 2
+        summaries = [self._summarize(chunk_values(min(rows, self.ntrials - start)))
+                     for start in range(0, self.ntrials, rows)]
+        
+        return self._set_summary(*reduce(_combine_summaries, summaries))
     
-     
     
-    def value(self):
+    def _value_jit(self, reducer, payoff):
         
-        '''Method to calculate the value of an european call option.'''
+        '''Method to calculate the value with the compiled kernel.'''
         
-        opt_values = []
-        for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
-        
-            opt_values += [(max(stk_prices[-1] - self.x, 0 )) * math.exp(-1*self.r * self.t)]
-            
-        self.mean = statistics.mean(opt_values)
-        self.stdev = statistics.pstdev(opt_values)
+        seeds = self._ss.spawn(1)[0].generate_state(_JIT_BLOCKS, np.uint64)
+        # An antithetic trial in the kernel prices a path and its mirror, as a pair.
+        ntrials = (self.ntrials + 1) // 2 if self.antithetic else self.ntrials
+        blocks = _mc_kernel(float(self.s), float(self.x), float(self.r), float(self.sigma), float(self.t),
+                            self._ndims(), ntrials, seeds, _KERNEL_REDUCERS[reducer], payoff is _call, self.antithetic)
         
-        return statistics.mean(opt_values)
+        return self._set_summary(*reduce(_combine_summaries, zip(*blocks)))
     
-
-
-
-
-# European Put Option
-class MCEuroPutOption(MCStockOption):
     
-    '''Defined a Monte Carlo European put option class.'''
+    def _value_parallel(self):
+        
+        '''Method to calculate the value with the trials split over worker processes.'''
+        
+        sizes = [self.ntrials // self.workers + (i < self.ntrials % self.workers) for i in range(self.workers)]
+        seeds = self._ss.spawn(self.workers)
+        options = dict(sobol=self.sobol, replicates=self.replicates, antithetic=self.antithetic, jit=self.jit)
+        
+        chunks = [(type(self), (self.s, self.x, self.r, self.sigma, self.t, self.nsteps, size), dict(options, seed=seed))
+                  for size, seed in zip(sizes, seeds) if size > 0]
+        with ProcessPoolExecutor(max_workers=len(chunks), mp_context=_worker_context(type(self))) as pool:
+            summaries = list(pool.map(_mc_trial_chunk, chunks))
+        
+        return self._set_summary(*reduce(_combine_summaries, summaries))
+    
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
+    def greek(self, param, h):
         
-        '''Initialize a MCEuroPutOption object from MCStockOption class'''
+        '''Method to estimate the sensitivity of the value to one parameter ('s', 'r', 'sigma' or 't')
+        by a central difference with step h, e.g. greek('s', 0.01*self.s) for delta.
         
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
+        Both re-pricings start from a copy of this option's SeedSequence, so they see the same
+        random numbers and their Monte Carlo noise cancels in the difference.'''
         
+        params = dict(s=self.s, x=self.x, r=self.r, sigma=self.sigma, t=self.t, nsteps=self.nsteps,
+                      ntrials=self.ntrials, sobol=self.sobol, replicates=self.replicates,
+                      antithetic=self.antithetic, workers=self.workers, jit=self.jit)
         
-    def __repr__(self):
+        # A copy per side, as spawning children advances a SeedSequence.
+        up = type(self)(**dict(params, seed=np.random.SeedSequence(self._ss.entropy, spawn_key=self._ss.spawn_key),
+                               **{param: getattr(self, param) + h}))
+        down = type(self)(**dict(params, seed=np.random.SeedSequence(self._ss.entropy, spawn_key=self._ss.spawn_key),
+                                 **{param: getattr(self, param) - h}))
         
-        '''Method to return a string representation of the object'''
+        return (up.value() - down.value()) / (2*h)
+    
+    
+    def stderr(self):
+        
+        '''Method to calculate the standard deviation error.'''
         
-        return 'MCEuroPutOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+        if hasattr(self, 'stdev'):
+            return self.stdev / math.sqrt(self.nsamples)
+        return 0
     
+
+
+# European Call option
+class MCEuroCallOption(MCStockOption):
     
+    '''Defined a Monte Carlo European call option class.'''
+    
+    __slots__ = ()
     
     
     def value(self):
         
-        '''Method to calculate the value of an european put option using Monte Carlo Simulation.'''
+        '''Method to calculate the value of an european call option.'''
         
-        opt_values = []
-        for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
+        return self._value_batch(_terminal, _call)
+    
+    
+    def _ndims(self):
         
-            opt_values += [(max(self.x - stk_prices[-1] , 0 )) * math.exp(-1*self.r * self.t)]
-            
-        self.mean = statistics.mean(opt_values)
-        self.stdev = statistics.pstdev(opt_values)
+        '''Method to return the number of simulated steps: the payoff only needs the terminal
+        price, which a single lognormal step samples exactly.'''
         
-        return statistics.mean(opt_values)
+        return 1
     
     
-   
+    def bs_value(self):
+        
+        '''Method to calculate the closed-form Black-Scholes value of an european call option.'''
+        
+        if self.sigma*math.sqrt(self.t) == 0:
+            return max(self.s - self.x*math.exp(-1*self.r * self.t), 0.0)
+        d1, d2 = _black_scholes_d(self.s, self.x, self.r, self.sigma, self.t)
+        return self.s*norm.cdf(d1) - self.x*math.exp(-1*self.r * self.t)*norm.cdf(d2)
     
-# Asian Call option    
-class MCAsianCallOption(MCStockOption):
+
+
+
+
+# European Put Option
+class MCEuroPutOption(MCStockOption):
+    
+    '''Defined a Monte Carlo European put option class.'''
+    
+    __slots__ = ()
     
-    '''Defined a Monte Carlo Asian call option class.'''
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
+    def value(self):
         
-        '''Initialize a MCAsianCallOption object from MCStockOption class'''
+        '''Method to calculate the value of an european put option using Monte Carlo Simulation.'''
         
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
+        return self._value_batch(_terminal, _put)
     
     
+    def _ndims(self):
+        
+        '''Method to return the number of simulated steps: the payoff only needs the terminal
+        price, which a single lognormal step samples exactly.'''
+        
+        return 1
+    
     
-    def __repr__(self):
+    def bs_value(self):
         
-        '''Method to return a string representation of the object'''
+        '''Method to calculate the closed-form Black-Scholes value of an european put option.'''
         
-        return 'MCAsianCallOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+        if self.sigma*math.sqrt(self.t) == 0:
+            return max(self.x*math.exp(-1*self.r * self.t) - self.s, 0.0)
+        d1, d2 = _black_scholes_d(self.s, self.x, self.r, self.sigma, self.t)
+        return self.x*math.exp(-1*self.r * self.t)*norm.cdf(-d2) - self.s*norm.cdf(-d1)
+    
     
+   
+    
+# Asian Call option    
+class MCAsianCallOption(MCStockOption):
+    
+    '''Defined a Monte Carlo Asian call option class.'''
+    
+    __slots__ = ()
     
     
     def value(self):
         
         '''Method to calculate the value of Asian call option using Monte Carlo Simulation.'''
         
-        opt_values = []
-        for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
-            avg_stk_price = statistics.mean(stk_prices)
-            opt_values += [(max(avg_stk_price - self.x, 0 )) * math.exp(-1*self.r * self.t)]
-            
-        self.mean = statistics.mean(opt_values)
-        self.stdev = statistics.pstdev(opt_values)
-        
-        return statistics.mean(opt_values)
+        return self._value_batch(np.mean, _call)
     
  
     
@@ -206,36 +715,14 @@ class MCAsianPutOption(MCStockOption):
     
     '''Defined a Monte Carlo Asian put option class.'''
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
-        
-        '''Initialize a MCAsianPutOption object from MCStockOption class'''
-        
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
-    
-    
-    def __repr__(self):
-        
-        '''Method to return a string representation of the object'''
-        
-        return 'MCAsianPutOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+    __slots__ = ()
     
     
     def value(self):
         
         '''Method to calculate the value of Asian put option using Monte Carlo Simulation.'''
         
-        opt_values = []
-        for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
-            avg_stk_price = statistics.mean(stk_prices)
-            opt_values += [(max(self.x - avg_stk_price , 0 )) * math.exp(-1*self.r * self.t)]
-            
-        self.mean = statistics.mean(opt_values)
-        self.stdev = statistics.pstdev(opt_values)
-        
-        return statistics.mean(opt_values)
+        return self._value_batch(np.mean, _put)
 
 
 
@@ -247,36 +734,14 @@ class MCLookbackCallOption(MCStockOption):
     
      '''Defined a Monte Carlo Lookback call option.'''
      
-     def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
-        
-        '''Initialize a MCALookbackCallOption object from MCStockOption class'''
-        
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
-    
-    
-     def __repr__(self):
-         
-         '''Method to return a string representation of the object'''
-        
-         return 'MCLookbackCallOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
-    
-    
+     __slots__ = ()
+     
+     
      def value(self):
          
          '''Method to calculate the value of look back call option using Monte Carlo simulation.'''
          
-         opt_values = []
-         for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
-            max_stk_price = max(stk_prices)
-            opt_values += [(max(max_stk_price - self.x, 0 )) * math.exp(-1*self.r * self.t)]
-            
-         self.mean = statistics.mean(opt_values)
-         self.stdev = statistics.pstdev(opt_values)
-        
-         return statistics.mean(opt_values)
+         return self._value_batch(np.max, _call)
 
 
 
@@ -286,36 +751,51 @@ class MCLookbackPutOption(MCStockOption):
     
     '''Defined a Monte Carlo Lookback put option.'''
     
-    def __init__(self, s, x, r, sigma, t, nsteps, ntrials):
-        
-        '''Initialize a MCLookbackPutOption object from MCStockOption class'''
-        
-        MCStockOption.__init__(self, s, x, r, sigma, t, nsteps, ntrials)
-    
-    
-    def __repr__(self):
-        
-        '''Method to return a string representation of the object'''
-        
-        return 'MCLookbackPutOption, s=' + '%4.2f'%self.s +', x=' + '%4.2f'%self.x + ', r=' + '%0.2f'%self.r +\
-                ', sigma='+'%4.2f'%self.sigma + ', t=' + '%4.2f'%self.t + ', nsteps=' + str(self.nsteps) +', ntrials=' + str(self.ntrials)
+    __slots__ = ()
     
     
     def value(self):
         
         '''Method to calculate the value of look back put option using Monte Carlo Simulation.'''
         
-        opt_values = []
-        for i in range(self.ntrials):
-            
-            stk_prices = MCStockOption.generate_stock_prices(self)
-            max_stk_price = min(stk_prices)
-            opt_values += [(max(self.x - max_stk_price , 0 )) * math.exp(-1*self.r * self.t)]
-            
-        self.mean = statistics.mean(opt_values)
-        self.stdev = statistics.pstdev(opt_values)
-        
-        return statistics.mean(opt_values)
+        return self._value_batch(np.min, _put)
+    
+    
+    
+# Price a chain of strikes from one simulation
+_CHAIN_KINDS = {'euro_call': (_terminal, _call), 'euro_put': (_terminal, _put),
+                'asian_call': (np.mean, _call), 'asian_put': (np.mean, _put),
+                'lookback_call': (np.max, _call), 'lookback_put': (np.min, _put)}
+
+
+def price_chain(s, strikes, r, sigma, t, nsteps, ntrials, kind='euro_call', seed=None):
+    
+    '''Price one kind of option (a key of _CHAIN_KINDS, e.g. 'asian_put') at every strike
+    from a single set of simulated paths, and return the arrays of values and standard errors.'''
+    
+    reducer, payoff = _CHAIN_KINDS[kind]
+    strikes = np.asarray(strikes, dtype=np.float64)
+    
+    # The strike only enters the payoff, so one set of paths serves the whole chain; as for
+    # the european option classes, a terminal payoff needs only one exact lognormal step.
+    rng = np.random.default_rng(seed)
+    ndims = 1 if reducer is _terminal else nsteps
+    disc = math.exp(-1*r * t)
+    rows = _chunk_rows(ndims)
+    
+    summaries = []
+    for start in range(0, ntrials, rows):
+        z = rng.standard_normal((min(rows, ntrials - start), ndims), dtype=_PATH_DTYPE)
+        paths = _gbm_paths(z, s, r, sigma, t)
+        levels = reducer(paths, axis=1).astype(np.float64)
+        opt_values = payoff(levels[:, None], strikes) * disc
+        
+        mean = opt_values.mean(axis=0)
+        deviations = opt_values - mean
+        summaries.append((len(opt_values), mean, (deviations * deviations).sum(axis=0)))
+    
+    n, mean, m2 = reduce(_combine_summaries, summaries)
+    return mean, np.sqrt(m2 / n) / math.sqrt(n)
     
     
     